@@ -1,15 +1,9 @@
-from openai import OpenAI
-from typing import Dict, Any
-import json
+from typing import Callable, Dict, Any, Optional
+import orjson
+import asyncio
 from pydantic import BaseModel, ValidationError
-from dotenv import load_dotenv
-import os
-from agents.base import create_completion
-
-load_dotenv()
-
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from agents.base import DEFAULT_MODEL, create_completion_stream
+from agents.cache import get_cache, make_key
 
 
 class StructuredAnswer(BaseModel):
@@ -35,27 +29,58 @@ class AnswerGenerator:
             "source": "TMDB API",
             "confidence": <confidence_score_between_0_and_1>
         }
-        Be factual and only use information from the provided data. Do not use prior knowledge. Remember that we are in year 2025 currently."""
+        Be factual and only use information from the provided data. Do not use prior knowledge. Remember that we are in year 2025 currently.
+        The user message contains the user query, the API endpoint used and the API response data."""
+        # Cache keys start from a digest of the static prompt, computed once
+        self.prompt_digest = make_key(DEFAULT_MODEL, self.system_prompt)
 
-    def generate_answer(self, user_query: str, api_data: Dict[str, Any], endpoint: str) -> StructuredAnswer:
-        """Generate structured final answer"""
+    async def generate_answer(
+        self,
+        user_query: str,
+        api_data: Dict[str, Any],
+        endpoint: str,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> StructuredAnswer:
+        """
+        Generate structured final answer. The completion is streamed: each chunk is
+        passed to on_token (if given) as soon as it arrives, and the JSON is only
+        parsed and validated once the stream closes.
+        """
+        cache = get_cache()
+        cache_key = make_key(
+            "answer", self.prompt_digest, endpoint, user_query,
+            orjson.dumps(api_data, option=orjson.OPT_SORT_KEYS).decode()
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if on_token:
+                on_token(cached)
+            return StructuredAnswer.model_validate_json(cached)
 
+        # Only per-request data goes in the user message; all static instructions live
+        # in the system prompt so the shared prompt prefix is eligible for caching.
         prompt = f"""
         User Query: {user_query}
         API Endpoint Used: {endpoint}
-        API Response Data: {json.dumps(api_data, indent=2)}
-        
-        Generate a helpful answer based on this data.
+        API Response Data: {orjson.dumps(api_data, option=orjson.OPT_INDENT_2).decode()}
         """
-        response = create_completion(client, system_prompt=self.system_prompt, user_prompt=prompt)
+        buffer = []
+        async for chunk in create_completion_stream(system_prompt=self.system_prompt, user_prompt=prompt):
+            buffer.append(chunk)
+            if on_token:
+                on_token(chunk)
+
         try:
-            return StructuredAnswer(**response)
+            answer = StructuredAnswer.model_validate_json("".join(buffer))
         except ValidationError as e:
             raise RuntimeError(f"Invalid LLM output schema: {e}")
 
+        cache.set(cache_key, answer.model_dump_json())
+        return answer
+
 
 if __name__ == "__main__":
     generator = AnswerGenerator()
     mock_data = {"results": [{"title": "Test Movie", "overview": "A test movie overview.", "release_date": "2023-01-01", "vote_average": 7}]}
-    answer = generator.generate_answer("Find movies", mock_data, "search_movie")
+    answer = asyncio.run(generator.generate_answer("Find movies", mock_data, "search_movie"))
     print(answer)
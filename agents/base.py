@@ -1,11 +1,66 @@
-import json
-from typing import Dict
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import functools
+import os
+import weakref
+import orjson
 
 
-def create_completion(client, system_prompt: str, user_prompt: str) -> Dict:
-        """Helper function to create a chat completion and parse JSON response"""
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo-1106",
+DEFAULT_MODEL = "gpt-3.5-turbo-1106"
+# Smaller, faster model for classification-style agents (router, extractors)
+FAST_MODEL = "gpt-4o-mini"
+FAST_MAX_TOKENS = 150
+
+BATCH_INSTRUCTIONS = """
+        The user message is a JSON object {"queries": [...]} holding several user queries.
+        Apply the instructions above to each query independently and return JSON:
+        {"results": [<one result object per query, in the same order as the queries>]}
+        """
+
+
+# One OpenAI client per event loop: its pooled connections belong to the loop that opened them
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+
+@functools.lru_cache(maxsize=32)
+def _batch_system_prompt(system_prompt: str) -> str:
+    """Append the batch instructions to a system prompt once per prompt"""
+    return system_prompt + BATCH_INSTRUCTIONS
+
+
+@functools.cache
+def load_env() -> None:
+    """Load the .env file once, on first use rather than at import time"""
+    load_dotenv()
+
+
+def get_client() -> AsyncOpenAI:
+    """Return the shared OpenAI client for the running event loop, creating it lazily"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        load_env()
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        _clients[loop] = client
+    return client
+
+
+async def create_completion(
+        system_prompt: str,
+        user_prompt: str,
+        model: str = DEFAULT_MODEL,
+        max_tokens: Optional[int] = None
+) -> str:
+        """
+        Helper function to create a chat completion and return the raw JSON response.
+        Callers decode it straight into their schema so the text is only parsed once.
+        The static system prompt always comes first so OpenAI can reuse its cached prefix.
+        """
+        response = await get_client().chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
             response_format={"type": "json_object"},
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -14,5 +69,53 @@ def create_completion(client, system_prompt: str, user_prompt: str) -> Dict:
             temperature=0.1
         )
 
-        result = json.loads(response.choices[0].message.content)
-        return result
+        return response.choices[0].message.content
+
+
+async def create_batch_completion(
+        system_prompt: str,
+        user_prompts: List[str],
+        model: str = DEFAULT_MODEL,
+        max_tokens_per_prompt: Optional[int] = None
+) -> List[Dict[str, Any]]:
+        """
+        Helper function to answer several user prompts with a single chat completion.
+        Returns one parsed JSON result per prompt, in the same order. Raises ValueError
+        (orjson.JSONDecodeError included) when the output is not one result per prompt.
+        """
+        response = await create_completion(
+            system_prompt=_batch_system_prompt(system_prompt),
+            user_prompt=orjson.dumps({"queries": user_prompts}).decode(),
+            model=model,
+            max_tokens=max_tokens_per_prompt * len(user_prompts) if max_tokens_per_prompt else None
+        )
+
+        response = orjson.loads(response)
+        results = response.get("results") if isinstance(response, dict) else None
+        if not isinstance(results, list) or len(results) != len(user_prompts):
+            raise ValueError("Batch completion did not return one result per query")
+        return results
+
+
+async def create_completion_stream(
+        system_prompt: str,
+        user_prompt: str,
+        model: str = DEFAULT_MODEL,
+        max_tokens: Optional[int] = None
+) -> AsyncIterator[str]:
+        """Helper function to stream a chat completion, yielding content chunks as they arrive"""
+        stream = await get_client().chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.1,
+            stream=True
+        )
+
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
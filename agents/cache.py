@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from typing import Optional, Protocol, Tuple
+import functools
+import hashlib
+import os
+import time
+from agents.base import load_env
+
+
+DEFAULT_CACHE_TTL = 3600
+CACHE_MAXSIZE = 1024
+
+
+class CacheBackend(Protocol):
+    """Interface shared by the exact-match cache backends"""
+
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        ...
+
+
+class InMemoryCache:
+    """In-process LRU cache with a per-entry expiry"""
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE, ttl: int = DEFAULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expiry, value = entry
+        if expiry < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class RedisCache:
+    """Redis-backed cache, shared across processes of a multi-worker deployment"""
+
+    def __init__(self, url: str, ttl: int = DEFAULT_CACHE_TTL):
+        import redis  # optional dependency, only needed when REDIS_URL is set
+
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self._client.set(key, value, ex=ttl or self.ttl)
+
+
+def make_key(*parts: str) -> str:
+    """Build a stable cache key from the parts that fully determine an LLM output"""
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+@functools.cache
+def get_cache() -> CacheBackend:
+    """Return the process-wide cache backend, configured from the environment on first use"""
+    load_env()
+    ttl = int(os.getenv("CACHE_TTL", DEFAULT_CACHE_TTL))
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        return RedisCache(redis_url, ttl=ttl)
+    return InMemoryCache(ttl=ttl)
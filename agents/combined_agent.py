@@ -0,0 +1,89 @@
+from pydantic import Field
+import asyncio
+import orjson
+from agents.base import FAST_MAX_TOKENS, FAST_MODEL, create_completion
+from agents.cache import get_cache, make_key
+from agents.param_extractor import (
+    EXTRACTORS,
+    GENRE_CATALOG,
+    GENRE_MAP,
+    ExtractedParams,
+    construct_params,
+    discover_params_from_response,
+    simple_extraction,
+)
+from agents.router_agent import APIDecision, decision_from_response
+
+
+class RoutedQuery(APIDecision):
+    """Schema for an API routing decision together with the extracted parameters"""
+    params: ExtractedParams = Field(default_factory=ExtractedParams)
+
+
+class RouteAndExtractAgent:
+    """
+    Router and parameter extractor fused into a single LLM round-trip.
+    The parameter schema to fill in is selected by the chosen endpoint.
+    """
+
+    def __init__(self):
+        # Genre name -> TMDB genre ID; replaced by the live catalog once it is fetched
+        self.genre_map = GENRE_MAP
+        self.system_prompt = """Pick the TMDB endpoint for the user query and extract its params (only values mentioned;
+        separate multiple values with commas):
+        - search_movie (movies by title): {"query": "<title_or_keywords>", "primary_release_year": <year_or_null>}
+        - discover_movies (movies by filters): {"primary_release_year": <year_or_null>, "with_genres": "<genres_or_null>", "with_people": "<actor_names_or_null>"}
+        - search_person (a person/actor): {"query": "<person_name>"}
+        - movie_certifications (certification list): {}
+        - genre_list (genre list): {}
+        Return JSON: {"endpoint": "<chosen_endpoint>", "reasoning": "<one short sentence>", "params": {...}}
+        """ + f"Valid genres: {GENRE_CATALOG}\n"
+        # Cache keys start from a digest of the static prompt, computed once
+        self.prompt_digest = make_key(FAST_MODEL, self.system_prompt)
+
+    async def route_and_extract(self, user_query: str) -> RoutedQuery:
+        """Determine which API endpoint to call and extract its parameters"""
+        cache = get_cache()
+        cache_key = make_key("route_and_extract", self.prompt_digest, user_query)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return RoutedQuery.model_validate_json(cached)
+
+        raw_response = await create_completion(
+            system_prompt=self.system_prompt,
+            user_prompt=user_query,
+            model=FAST_MODEL,
+            max_tokens=FAST_MAX_TOKENS
+        )
+        try:
+            response = orjson.loads(raw_response)
+        except orjson.JSONDecodeError:  # e.g. output truncated by max_tokens
+            response = None
+        decision = decision_from_response(response) if isinstance(response, dict) else None
+        if decision is None:
+            return RoutedQuery(
+                endpoint="search_movie",
+                reasoning="Fallback due to invalid model output",
+                params=simple_extraction(user_query, "search_movie")
+            )
+
+        raw_params = response.get("params")
+        if not isinstance(raw_params, dict):
+            raw_params = {}
+        if decision.endpoint == "discover_movies":
+            params = discover_params_from_response(raw_params, self.genre_map)
+        elif decision.endpoint in EXTRACTORS:
+            # minimal safeguard
+            params = construct_params(raw_params)
+        else:
+            params = ExtractedParams()
+
+        routed = RoutedQuery.model_construct(endpoint=decision.endpoint, reasoning=decision.reasoning, params=params)
+        cache.set(cache_key, routed.model_dump_json())
+        return routed
+
+
+if __name__ == "__main__":
+    agent = RouteAndExtractAgent()
+    routed = asyncio.run(agent.route_and_extract("Find action movies from 2023 with Keanu Reeves"))
+    print(routed)
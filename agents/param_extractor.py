@@ -1,18 +1,15 @@
-from openai import OpenAI
-from pydantic import BaseModel
-from typing import Optional
+import asyncio
+from pydantic import BaseModel, ValidationError
+from typing import Any, Callable, Dict, List, Mapping, Optional
 import re
-from dotenv import load_dotenv
-import os
-from agents.base import create_completion
+import types
+import orjson
+from agents.base import FAST_MAX_TOKENS, FAST_MODEL, create_batch_completion, create_completion
+from agents.cache import get_cache, make_key
 
-load_dotenv()
 
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-
-GENRE_MAP = {
+# Read-only: shared by every extractor and the regex fallback
+GENRE_MAP = types.MappingProxyType({
     "action": 28, "adventure": 12, "animation": 16,
     "comedy": 35, "crime": 80, "documentary": 99,
     "drama": 18, "family": 10751, "fantasy": 14,
@@ -20,11 +17,31 @@ GENRE_MAP = {
     "mystery": 9648, "romance": 10749, "science fiction": 878,
     "tv movie": 10770, "thriller": 53, "war": 10752,
     "western": 37
-}
+})
+GENRE_NAMES = tuple(GENRE_MAP)
+
+# Patterns for the regex fallback, compiled once at import time.
+# All genre names are matched in a single pass (longest alternatives first).
+_YEAR_RE = re.compile(r'\b(20\d{2}|19\d{2})\b')
+_GENRE_RE = re.compile("|".join(re.escape(name) for name in sorted(GENRE_NAMES, key=len, reverse=True)))
+_PERSON_SPLIT_RE = re.compile(r'with|starring|featuring')
+# Stable genre catalog for the extraction prompts, so the model names genres the
+# way GENRE_MAP expects. Built once: system prompts must not change between calls
+# for OpenAI's automatic prompt caching to reuse their prefix.
+GENRE_CATALOG = ", ".join(GENRE_NAMES)
+
+_STOP_WORDS = frozenset([
+    "find", "search", "for", "movies", "movie", "about", "who", "is", "the",
+    "a", "an", "in", "on", "at", "of", "and", "with", "starring"
+])
 
 
 class ExtractedParams(BaseModel):
-    """Schema for extracted parameters"""
+    """
+    Schema for extracted parameters, shared by every extractor and the TMDB client.
+    with_people_names holds actor names as extracted; with_people holds the
+    TMDB person IDs they resolve to.
+    """
     query: Optional[str] = None
     primary_release_year: Optional[int] = None
     with_genres: Optional[str] = None
@@ -33,147 +50,316 @@ class ExtractedParams(BaseModel):
     sort_by: Optional[str] = None
 
 
-class SearchMovieAgent:
-    def __init__(self):
-        self.system_prompt = """You are a parameter extraction agent for TMDB API calls to /search/movie.
-        Your job is to extract relevant parameters from user queries. The parameters to extract are:
-        - query: The movie title or keywords
-        - primary_release_year: The release year of the movie (if mentioned)
-
-        Return the extracted parameters in JSON format following this schema:
+PARAM_FIELDS = frozenset(ExtractedParams.model_fields)
+
+
+def _coerce_param(key: str, value: Any) -> Any:
+    """
+    Coerce one LLM output value to its ExtractedParams field type, or return None if
+    it cannot be: the year must be an int or a digit string, every other field a string
+    (a list of strings is joined with commas).
+    """
+    if key == "primary_release_year":
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().isdigit():
+            return int(value)
+        return None
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return ",".join(value) or None
+    return value if isinstance(value, str) else None
+
+
+def construct_params(values: Dict[str, Any]) -> ExtractedParams:
+    """
+    Build ExtractedParams from JSON-mode LLM output without a full validation pass.
+    Unknown keys are dropped, as are null and wrong-typed values, so the result always
+    validates again when it is read back from the cache.
+    """
+    params = {}
+    for key, value in values.items():
+        if key in PARAM_FIELDS:
+            value = _coerce_param(key, value)
+            if value is not None:
+                params[key] = value
+    return ExtractedParams.model_construct(**params)
+
+
+def discover_params_from_response(
+    response: Dict[str, Any],
+    genre_map: Mapping[str, int] = GENRE_MAP
+) -> ExtractedParams:
+    """
+    Convert raw /discover/movie extraction output into ExtractedParams:
+    genre names (a comma separated string or a list) are mapped to TMDB genre IDs
+    (with genre_map, GENRE_MAP by default) and actor names are kept aside in
+    with_people_names until they are resolved to person IDs.
+    """
+    genres = response.get("with_genres")
+    if isinstance(genres, str):
+        genres = genres.split(",")
+    genre_ids = []
+    if isinstance(genres, list):
+        for genre in genres:
+            if isinstance(genre, str):
+                genre = genre.strip().lower()
+                if genre in genre_map:
+                    genre_ids.append(str(genre_map[genre]))
+
+    # minimal safeguard
+    return construct_params(
         {
-            "query": "<movie_title_or_keywords>",
-            "primary_release_year": <release_year_or_null>
+            "primary_release_year": response.get("primary_release_year"),
+            "with_genres": ",".join(genre_ids) or None,
+            "with_people_names": response.get("with_people"),
         }
+    )
+
+
+def parse_batch_item(
+    parse: Callable[[Dict[str, Any]], ExtractedParams],
+    response: Any
+) -> Optional[ExtractedParams]:
+    """Parse one result of a batch completion, or return None if it does not match the schema"""
+    if not isinstance(response, dict):
+        return None
+    try:
+        return parse(response)
+    except (ValidationError, AttributeError, TypeError):
+        return None
+
+
+def simple_extraction(user_query: str, endpoint: str) -> ExtractedParams:
+    """A simple regex-based parameter extraction, used as fallback when no LLM output is usable"""
+    params = ExtractedParams()
+    query_lower = user_query.lower()
+
+    # Extract year using regex
+    year_match = _YEAR_RE.search(user_query)
+    if year_match:
+        params.primary_release_year = int(year_match.group())
+
+    # Extract genre
+    found_genres = set(_GENRE_RE.findall(query_lower))
+    genre_ids = [str(genre_id) for genre_name, genre_id in GENRE_MAP.items() if genre_name in found_genres]
+    if genre_ids:
+        params.with_genres = ",".join(genre_ids)
+
+    # Extract person name (simple pattern)
+    if "with" in query_lower or "starring" in query_lower:
+        # This is simplified - in production would use NER (Named Entity Recognition)
+        parts = _PERSON_SPLIT_RE.split(query_lower, maxsplit=1)
+        if len(parts) > 1:
+            potential_name = parts[1].strip().split()[0:2]  # First 2 words
+            params.with_people_names = " ".join(potential_name).title()
+
+    # For search endpoints, extract query
+    if endpoint in ["search_movie", "search_person"]:
+        # Remove common words and extract main query
+        words = query_lower.split()
+        query_words = [w for w in words if w not in _STOP_WORDS]
+        params.query = " ".join(query_words[:3])  # First 3 words as query
+    
+    return params
+
+
+class SearchMovieAgent:
+    def __init__(self):
+        self.system_prompt = """Extract /search/movie parameters from the user query: the movie title or keywords
+        and the release year if mentioned.
+        Return JSON: {"query": "<movie_title_or_keywords>", "primary_release_year": <release_year_or_null>}
         """
+        self.prompt_digest = make_key(FAST_MODEL, self.system_prompt)
 
-    def extract(self, user_query: str) -> ExtractedParams:
+    async def extract(self, user_query: str) -> ExtractedParams:
         """Extract parameters for /search/movie endpoint"""
-        response = create_completion(client, system_prompt=self.system_prompt, user_prompt=user_query)
+        response = await create_completion(
+            system_prompt=self.system_prompt,
+            user_prompt=user_query,
+            model=FAST_MODEL,
+            max_tokens=FAST_MAX_TOKENS
+        )
 
         # minimal safeguard
-        return ExtractedParams.model_validate(response, strict=False)
+        return ExtractedParams.model_validate_json(response)
+
+    async def extract_many(self, user_queries: List[str]) -> List[Optional[ExtractedParams]]:
+        """
+        Extract parameters for /search/movie endpoint for several queries in one request.
+        Results that do not match the schema are returned as None.
+        """
+        responses = await create_batch_completion(
+            system_prompt=self.system_prompt,
+            user_prompts=user_queries,
+            model=FAST_MODEL,
+            max_tokens_per_prompt=FAST_MAX_TOKENS
+        )
+        return [parse_batch_item(ExtractedParams.model_validate, response) for response in responses]
 
 
 class DiscoverMoviesAgent:
     def __init__(self):
-        self.system_prompt = """You are a parameter extraction agent for TMDB API calls to /discover/movie.
-        Your job is to extract relevant parameters from user queries. The parameters to extract are:
-        - primary_release_year: The release year of the movies (if mentioned)
-        - with_genres: The genres of the movies (if mentioned), separated by commas
-        - with_people: The name of actors/actresses (if mentioned), separated by commas
-
-        Return the extracted parameters in JSON format following this schema:
-        {
-            "primary_release_year": <primary_release_year_or_null>,
-            "with_genres": "<with_genres_or_null>",
-            "with_people": "<with_people or_null>"
-        }
-        """
+        self.system_prompt = """Extract /discover/movie parameters from the user query: the release year, the genres
+        and the actor/actress names, each only if mentioned; separate multiple values with commas.
+        Return JSON: {"primary_release_year": <year_or_null>, "with_genres": "<genres_or_null>", "with_people": "<names_or_null>"}
+        """ + f"Valid genres: {GENRE_CATALOG}\n"
+        self.prompt_digest = make_key(FAST_MODEL, self.system_prompt)
 
-    def extract(self, user_query: str) -> ExtractedParams:
+    async def extract(self, user_query: str) -> ExtractedParams:
         """Extract parameters for /discover/movie endpoint"""
-        response = create_completion(client, system_prompt=self.system_prompt, user_prompt=user_query)
-
-        if response.get("with_genres"):
-            genres = response.get("with_genres").lower().split(",")
-            genre_ids = []
-            for genre in genres:
-                genre = genre.strip()
-                if genre in GENRE_MAP:
-                    genre_ids.append(str(GENRE_MAP[genre]))
-            response["with_genres"] = ",".join(genre_ids)
+        response = await create_completion(
+            system_prompt=self.system_prompt,
+            user_prompt=user_query,
+            model=FAST_MODEL,
+            max_tokens=FAST_MAX_TOKENS
+        )
+        return discover_params_from_response(orjson.loads(response))
 
-        # minimal safeguard
-        return ExtractedParams.model_validate(
-            {
-                "primary_release_year": response.get("primary_release_year"),
-                "with_genres": response.get("with_genres"),
-                "with_people_names": response.get("with_people"),
-            },
-            strict=False
+    async def extract_many(self, user_queries: List[str]) -> List[Optional[ExtractedParams]]:
+        """
+        Extract parameters for /discover/movie endpoint for several queries in one request.
+        Results that do not match the schema are returned as None.
+        """
+        responses = await create_batch_completion(
+            system_prompt=self.system_prompt,
+            user_prompts=user_queries,
+            model=FAST_MODEL,
+            max_tokens_per_prompt=FAST_MAX_TOKENS
         )
+        return [parse_batch_item(discover_params_from_response, response) for response in responses]
 
 
 class SearchPersonAgent:
     def __init__(self):
-        self.system_prompt = """You are a parameter extraction agent for TMDB API calls to /search/person.
-        Your job is to extract relevant parameters from user queries. The parameters to extract are:
-        - query: The name of the person/actor or known as name (if mentioned)
-        Return the extracted parameters in JSON format following this schema:
-        {
-            "query": "<person_name_or_keywords>"
-        }
+        self.system_prompt = """Extract /search/person parameters from the user query: the name (or known-as name)
+        of the person/actor.
+        Return JSON: {"query": "<person_name_or_keywords>"}
         """
+        self.prompt_digest = make_key(FAST_MODEL, self.system_prompt)
 
-    def extract(self, user_query: str) -> ExtractedParams:
+    async def extract(self, user_query: str) -> ExtractedParams:
         """Extract parameters for /search/person endpoint"""
-        response = create_completion(client, system_prompt=self.system_prompt, user_prompt=user_query)
+        response = await create_completion(
+            system_prompt=self.system_prompt,
+            user_prompt=user_query,
+            model=FAST_MODEL,
+            max_tokens=FAST_MAX_TOKENS
+        )
 
         # minimal safeguard
-        return ExtractedParams.model_validate(response, strict=False)
+        return ExtractedParams.model_validate_json(response)
 
+    async def extract_many(self, user_queries: List[str]) -> List[Optional[ExtractedParams]]:
+        """
+        Extract parameters for /search/person endpoint for several queries in one request.
+        Results that do not match the schema are returned as None.
+        """
+        responses = await create_batch_completion(
+            system_prompt=self.system_prompt,
+            user_prompts=user_queries,
+            model=FAST_MODEL,
+            max_tokens_per_prompt=FAST_MAX_TOKENS
+        )
+        return [parse_batch_item(ExtractedParams.model_validate, response) for response in responses]
 
+
+# Agents are stateless, so a single shared instance per endpoint is enough
 EXTRACTORS = {
-    "search_movie": SearchMovieAgent,
-    "discover_movies": DiscoverMoviesAgent,
-    "search_person": SearchPersonAgent,
+    "search_movie": SearchMovieAgent(),
+    "discover_movies": DiscoverMoviesAgent(),
+    "search_person": SearchPersonAgent(),
 }
 
 
 class ParameterExtractor:
-    def extract(self, user_query: str, endpoint: str) -> ExtractedParams:
+    async def extract(self, user_query: str, endpoint: str) -> ExtractedParams:
         """Extract parameters based on endpoint type"""
 
         # Use specialized agents if available
         if endpoint in EXTRACTORS:
-            agent = EXTRACTORS[endpoint]()
-            params = agent.extract(user_query)
+            cache = get_cache()
+            agent = EXTRACTORS[endpoint]
+            cache_key = make_key("extract", agent.prompt_digest, user_query)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return ExtractedParams.model_validate_json(cached)
+
+            params = await agent.extract(user_query)
+            cache.set(cache_key, params.model_dump_json())
         else: # Else, use simple regex-based extraction as fallback
             params = self._simple_extraction(user_query, endpoint)
 
         return params
 
+    async def extract_many(self, user_queries: List[str], endpoints: List[str]) -> List[ExtractedParams]:
+        """
+        Extract parameters for several (query, endpoint) pairs. Uncached queries are
+        grouped by endpoint and each group is sent to its agent as a single LLM request.
+        A result the model got wrong falls back to the regex extraction for that query only;
+        an unusable batch falls back to one request per query.
+        """
+        if len(user_queries) != len(endpoints):
+            raise ValueError("Expected one endpoint per user query")
+
+        cache = get_cache()
+        results: List[Optional[ExtractedParams]] = [None] * len(user_queries)
+        batches: Dict[str, List[int]] = {}
+        cache_keys: Dict[int, str] = {}
+
+        for i, (user_query, endpoint) in enumerate(zip(user_queries, endpoints)):
+            if endpoint not in EXTRACTORS:
+                results[i] = self._simple_extraction(user_query, endpoint)
+                continue
+
+            cache_keys[i] = make_key("extract", EXTRACTORS[endpoint].prompt_digest, user_query)
+            cached = cache.get(cache_keys[i])
+            if cached is not None:
+                results[i] = ExtractedParams.model_validate_json(cached)
+            else:
+                batches.setdefault(endpoint, []).append(i)
+
+        batch_results = await asyncio.gather(*(
+            self._extract_batch(endpoint, [user_queries[i] for i in indices])
+            for endpoint, indices in batches.items()
+        ))
+        for indices, params_list in zip(batches.values(), batch_results):
+            for i, params in zip(indices, params_list):
+                if params is None:
+                    params = self._simple_extraction(user_queries[i], endpoints[i])
+                else:
+                    cache.set(cache_keys[i], params.model_dump_json())
+                results[i] = params
+
+        return results
+
+    async def _extract_batch(self, endpoint: str, user_queries: List[str]) -> List[Optional[ExtractedParams]]:
+        """
+        Extract parameters for queries of one endpoint in a single request. If the batch
+        output is unusable (truncated JSON, wrong result count), each query gets its own
+        request; None marks a query whose output is still unusable.
+        """
+        agent = EXTRACTORS[endpoint]
+        try:
+            return await agent.extract_many(user_queries)
+        except ValueError:
+            return await asyncio.gather(*(self._extract_one(agent, user_query) for user_query in user_queries))
+
+    async def _extract_one(self, agent: Any, user_query: str) -> Optional[ExtractedParams]:
+        """Extract parameters for a single query, or return None if the output does not match the schema"""
+        try:
+            return await agent.extract(user_query)
+        except (ValueError, AttributeError, TypeError):
+            return None
+
     def _simple_extraction(self, user_query: str, endpoint: str) -> ExtractedParams:
         """A simple regex-based parameter extraction as fallback"""
-        params = ExtractedParams()
-        # Extract year using regex
-        year_match = re.search(r'\b(20\d{2}|19\d{2})\b', user_query)
-        if year_match:
-            params.primary_release_year = int(year_match.group())
-
-        # Extract genre
-        query_lower = user_query.lower()
-        genre_ids = []
-        for genre_name, genre_id in GENRE_MAP.items():
-            if genre_name in query_lower:
-                genre_ids.append(str(genre_id))
-        if genre_ids:
-            params.with_genres = ",".join(genre_ids)
-
-        # Extract person name (simple pattern)
-        if "with" in query_lower or "starring" in query_lower:
-            # This is simplified - in production would use NER (Named Entity Recognition)
-            parts = re.split(r'with|starring|featuring', query_lower, maxsplit=1)
-            if len(parts) > 1:
-                potential_name = parts[1].strip().split()[0:2]  # First 2 words
-                params.person_name = " ".join(potential_name).title()
-
-        # For search endpoints, extract query
-        if endpoint in ["search_movie", "search_person"]:
-            # Remove common words and extract main query
-            stop_words = ["find", "search", "for", "movies", "movie", "about", "who", "is", "the", "a", "an", "in", "on", "at", "of", "and", "with", "starring"]
-            words = user_query.lower().split()
-            query_words = [w for w in words if w not in stop_words]
-            params.query = " ".join(query_words[:3])  # First 3 words as query
-        
-        return params
+        return simple_extraction(user_query, endpoint)
 
 
 if __name__ == "__main__":
     extractor = ParameterExtractor()
-    params = extractor.extract(
+    params = asyncio.run(extractor.extract(
         "Find action movies from 2023 with Keanu Reeves",
         "discover_movies"
-    )
+    ))
     print(params)
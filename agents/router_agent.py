@@ -1,59 +1,152 @@
-from openai import OpenAI
 from pydantic import BaseModel, ValidationError
-from typing import Literal
-from dotenv import load_dotenv
+from typing import Any, Dict, List, Literal, Optional, get_args
+import asyncio
+import functools
 import os
-from agents.base import create_completion
+from agents.base import FAST_MAX_TOKENS, FAST_MODEL, create_batch_completion, create_completion, load_env
+from agents.cache import get_cache, make_key
+from agents.semantic_cache import SemanticCache, embed
 
-load_dotenv()
 
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+Endpoint = Literal[
+    "search_movie",
+    "discover_movies", 
+    "search_person",
+    "movie_certifications",
+    "genre_list",
+]
+ENDPOINTS = frozenset(get_args(Endpoint))
 
 
 class APIDecision(BaseModel):
     """Schema for API routing decision"""
-    endpoint: Literal[
-        "search_movie",
-        "discover_movies", 
-        "search_person",
-        "movie_certifications",
-        "genre_list",
-    ]
+    endpoint: Endpoint
     reasoning: str
 
 
+def decision_from_response(response: Dict[str, Any]) -> Optional[APIDecision]:
+    """
+    Build an APIDecision from JSON-mode LLM output, or return None if it does not
+    match the schema. Only the two fields are checked, so the full Pydantic
+    validation pass is skipped via model_construct.
+    """
+    endpoint = response.get("endpoint")
+    reasoning = response.get("reasoning")
+    if endpoint not in ENDPOINTS or not isinstance(reasoning, str):
+        return None
+    return APIDecision.model_construct(endpoint=endpoint, reasoning=reasoning)
+
+
+@functools.cache
+def get_semantic_cache() -> SemanticCache:
+    """Return the router's semantic cache, loading it from disk on first use"""
+    load_env()
+    return SemanticCache(
+        path=os.getenv("ROUTER_SEMANTIC_CACHE_PATH", ".cache/router_semantic_cache.npz")
+    )
+
+
 class RouterAgent:
     def __init__(self):
-        self.system_prompt = """You are a TMDB API router. Your job is to analyze user queries and determine which TMDB endpoint to call.
-
-        Available endpoints:
-        - search_movie: When user wants to search movies by title
-        - discover_movies: When user wants movies with filters (genre, year, actor, etc.)
-        - search_person: When user wants to find a person/actor
-        - movie_certifications: Get an up to date list of the officially supported movie certifications on TMDB.
-        - genre_list: Get the list of official genres for movies.
-
-        Return your decision in JSON format following this schema:
-        {
-            "endpoint": "<chosen_endpoint>",
-            "reasoning": "<explanation>",
-        }
+        self.system_prompt = """Pick the TMDB endpoint for the user query:
+        search_movie (movies by title), discover_movies (movies by genre/year/actor filters),
+        search_person (a person/actor), movie_certifications (certification list), genre_list (genre list).
+        Return JSON: {"endpoint": "<chosen_endpoint>", "reasoning": "<one short sentence>"}
         """
+        # Cache keys start from a digest of the static prompt, computed once
+        self.prompt_digest = make_key(FAST_MODEL, self.system_prompt)
 
-    def route(self, user_query: str) -> APIDecision:
+    async def route(self, user_query: str) -> APIDecision:
         """Determine which API endpoint to call"""
-        response = create_completion(client, system_prompt=self.system_prompt, user_prompt=user_query)
+        cache = get_cache()
+        cache_key = make_key("route", self.prompt_digest, user_query)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return APIDecision.model_validate_json(cached)
+
+        # Differently phrased queries with the same intent map to the same endpoint.
+        # The semantic cache is an optimization only: if embedding fails, it is skipped.
+        semantic_cache = get_semantic_cache()
+        try:
+            query_vector = await embed(user_query)
+        except Exception:
+            query_vector = None
+        if query_vector is not None:
+            similar = semantic_cache.lookup(query_vector)
+            if similar is not None:
+                return APIDecision.model_validate_json(similar)
+
+        response = await create_completion(
+            system_prompt=self.system_prompt,
+            user_prompt=user_query,
+            model=FAST_MODEL,
+            max_tokens=FAST_MAX_TOKENS
+        )
         try:
-            return APIDecision(**response)
+            # parse and validate in a single pass over the raw JSON
+            decision = APIDecision.model_validate_json(response)
         except ValidationError:
             return APIDecision(
                 endpoint="search_movie",
                 reasoning="Fallback due to invalid model output"
             )
 
+        decision_json = decision.model_dump_json()
+        cache.set(cache_key, decision_json)
+        if query_vector is not None:
+            semantic_cache.add(query_vector, decision_json)
+        return decision
+
+    async def route_many(self, user_queries: List[str]) -> List[APIDecision]:
+        """
+        Determine the API endpoint for several queries at once. Queries that are not
+        cached are routed together in a single LLM request; order is preserved.
+        If the batch output is unusable, they are routed one request per query.
+        """
+        cache = get_cache()
+        cache_keys = [make_key("route", self.prompt_digest, q) for q in user_queries]
+        decisions: List[Optional[APIDecision]] = []
+        for cache_key in cache_keys:
+            cached = cache.get(cache_key)
+            decisions.append(APIDecision.model_validate_json(cached) if cached is not None else None)
+
+        misses = [i for i, decision in enumerate(decisions) if decision is None]
+        if not misses:
+            return decisions
+
+        try:
+            responses = await create_batch_completion(
+                system_prompt=self.system_prompt,
+                user_prompts=[user_queries[i] for i in misses],
+                model=FAST_MODEL,
+                max_tokens_per_prompt=FAST_MAX_TOKENS
+            )
+        except ValueError:
+            # Truncated or miscounted batch output: route the misses one by one instead
+            routed = await asyncio.gather(*(self.route(user_queries[i]) for i in misses))
+            for i, decision in zip(misses, routed):
+                decisions[i] = decision
+            return decisions
+
+        for i, response in zip(misses, responses):
+            decision = decision_from_response(response) if isinstance(response, dict) else None
+            if decision is None:
+                decision = APIDecision(
+                    endpoint="search_movie",
+                    reasoning="Fallback due to invalid model output"
+                )
+            else:
+                cache.set(cache_keys[i], decision.model_dump_json())
+            decisions[i] = decision
+
+        return decisions
+
+    def route_sync(self, user_query: str) -> APIDecision:
+        """Blocking wrapper around route for callers without an event loop"""
+        return asyncio.run(self.route(user_query))
+
 
 if __name__ == "__main__":
     router = RouterAgent()
-    decision = router.route("Find action movies from 2023 with Keanu Reeves")
+    decision = router.route_sync("Find action movies from 2023 with Keanu Reeves")
     print(decision)
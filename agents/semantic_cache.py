@@ -0,0 +1,136 @@
+from typing import List, Optional
+import atexit
+import os
+import time
+import numpy as np
+import orjson
+from agents.base import get_client
+
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAXSIZE = 10_000
+
+
+async def embed(text: str) -> np.ndarray:
+    """Embed text and L2-normalize it so that a dot product is a cosine similarity"""
+    response = await get_client().embeddings.create(model=EMBEDDING_MODEL, input=text)
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache over normalized embeddings. Lookups are a single
+    matrix-vector product, which is fast enough for up to ~10k entries.
+    When a path is given, entries are loaded from it on start and saved back on exit.
+    With a ttl (in seconds), entries older than that are ignored by lookups and
+    dropped when the cache is saved. Beyond maxsize entries the oldest are overwritten.
+
+    Entries live in preallocated buffers that double in capacity up to maxsize and are
+    then reused as a ring, so an insert never copies the whole index.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl: Optional[float] = None,
+        maxsize: int = SEMANTIC_CACHE_MAXSIZE
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._vectors: Optional[np.ndarray] = None  # (capacity, dim) buffer
+        self._expiries: Optional[np.ndarray] = None  # (capacity,) buffer
+        self._values: List[str] = []
+        self._size = 0  # filled rows
+        self._next = 0  # row the next entry is written to; the oldest row once the ring is full
+
+        if path:
+            if os.path.exists(path):
+                self.load()
+            atexit.register(self.save)
+
+    def lookup(self, vector: np.ndarray) -> Optional[str]:
+        """Return the value of the most similar entry if it is above the threshold"""
+        if self._size == 0:
+            return None
+
+        similarities = self._vectors[:self._size] @ vector
+        similarities[self._expiries[:self._size] < time.time()] = -np.inf
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            return self._values[best]
+        return None
+
+    def add(self, vector: np.ndarray, value: str) -> None:
+        expiry = time.time() + self.ttl if self.ttl is not None else np.inf
+        if self._vectors is None:
+            self._allocate(min(16, self.maxsize), vector.shape[0], vector.dtype)
+        elif self._size == len(self._vectors) and self._size < self.maxsize:
+            self._grow(min(max(2 * self._size, 16), self.maxsize))
+
+        row = self._next
+        self._vectors[row] = vector
+        self._expiries[row] = expiry
+        if row == len(self._values):
+            self._values.append(value)
+        else:
+            self._values[row] = value
+        self._size = max(self._size, row + 1)
+        self._next = (row + 1) % self.maxsize
+
+    def _allocate(self, capacity: int, dim: int, dtype: np.dtype) -> None:
+        self._vectors = np.empty((capacity, dim), dtype=dtype)
+        self._expiries = np.empty(capacity)
+        self._values = []
+        self._size = self._next = 0
+
+    def _grow(self, capacity: int) -> None:
+        """Move the (not yet wrapped) entries into buffers of a larger capacity"""
+        vectors, expiries = self._vectors, self._expiries
+        self._vectors = np.empty((capacity, vectors.shape[1]), dtype=vectors.dtype)
+        self._expiries = np.empty(capacity)
+        self._vectors[:self._size] = vectors[:self._size]
+        self._expiries[:self._size] = expiries[:self._size]
+
+    def _ordered(self) -> np.ndarray:
+        """Indices of the live (unexpired) rows, oldest first"""
+        order = np.arange(self._size)
+        if self._size == self.maxsize:
+            order = np.roll(order, -self._next)
+        return order[self._expiries[order] >= time.time()]
+
+    def _set_rows(self, vectors: np.ndarray, expiries: np.ndarray, values: List[str]) -> None:
+        """Replace the contents with the given rows (oldest first), keeping the newest maxsize"""
+        vectors, expiries, values = vectors[-self.maxsize:], expiries[-self.maxsize:], values[-self.maxsize:]
+        self._vectors = np.ascontiguousarray(vectors)
+        self._expiries = np.array(expiries, dtype=float)
+        self._values = list(values)
+        self._size = len(values)
+        self._next = self._size % self.maxsize
+
+    def load(self) -> None:
+        with np.load(self.path) as data:
+            values = data["values"]
+            # values are stored as one JSON-encoded byte buffer; older files hold a unicode array
+            values = values.tolist() if values.dtype.kind == "U" else orjson.loads(values.tobytes())
+            if "expiries" in data.files:
+                expiries = data["expiries"]
+            else:
+                expiries = np.full(len(values), np.inf)
+            self._set_rows(data["vectors"], expiries, values)
+
+    def save(self) -> None:
+        order = self._ordered() if self._size else np.arange(0)
+        if len(order) == 0:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # A fixed-width unicode array would pad every value to the longest one
+        values = np.frombuffer(orjson.dumps([self._values[i] for i in order]), dtype=np.uint8)
+        with open(self.path, "wb") as f:
+            np.savez(f, vectors=self._vectors[order], values=values, expiries=self._expiries[order])
@@ -1,34 +1,41 @@
-from typing import Dict, Any, List
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+
+POSTER_TMPL = "https://image.tmdb.org/t/p/w500{}"
+OVERVIEW_MAX_CHARS = 200
+
+
+@dataclass(slots=True, frozen=True)
+class Movie:
+    """
+    Normalized movie record. Slotted, so a result list costs no per-movie dict;
+    orjson serializes it like the equivalent dict.
+    """
+    id: Optional[int]
+    title: Optional[str]
+    release_date: Optional[str]
+    overview: str
+    popularity: float
+    vote_average: Optional[float]
+    vote_count: Optional[int]
+    poster_path: Optional[str]
 
 
 class ResponseParser:
+    def __init__(self):
+        # endpoint -> normalizer, looked up once per response
+        self._parsers = {
+            "search_movie": self._parse_movies,
+            "discover_movies": self._parse_movies,
+            "search_person": self._parse_persons,
+        }
+
     def parse_response(self, endpoint: str, api_response: Dict[str, Any]) -> Dict[str, Any]:
         """Parse and normalize API response"""
-
-        if endpoint == "search_movie":
-            movies = self._normalize_movies_list(api_response)
-            return {
-                "movies": movies,
-                "total_results": api_response.get("total_results", 0),
-                "page": api_response.get("page", 1)
-            }
-        elif endpoint == "discover_movies":
-            movies = self._normalize_movies_list(api_response)
-            return {
-                "movies": movies,
-                "total_results": api_response.get("total_results", 0),
-                "page": api_response.get("page", 1)
-            }
-        elif endpoint == "search_person":
-            persons = api_response.get("results", [])
-            normalized = []
-            for person in persons[:3]:
-                normalized.append(self._normalize_person(person))
-            return {
-                "persons": normalized,
-                "total_results": api_response.get("total_results", 0),
-                "page": api_response.get("page", 1)
-            }
+        parser = self._parsers.get(endpoint)
+        if parser is not None:
+            return parser(api_response)
 
         # fallback schema
         return {
@@ -36,28 +43,40 @@ class ResponseParser:
             "note": "No normalization applied for this endpoint"
         }
 
-    def _normalize_movie(self, movie_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Normalize movie data to consistent schema"""
+    def _parse_movies(self, api_response: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalize a movie search or discover response"""
+        return {
+            "movies": self._normalize_movies_list(api_response),
+            "total_results": api_response.get("total_results", 0),
+            "page": api_response.get("page", 1)
+        }
+
+    def _parse_persons(self, api_response: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalize a person search response"""
         return {
-            "id": movie_data.get("id"),
-            "title": movie_data.get("title"),
-            "release_date": movie_data.get("release_date"),
-            "overview": movie_data.get("overview", "")[:200] + "..." if movie_data.get("overview") else "",
-            "popularity": round(movie_data.get("popularity", 0), 2),
-            "vote_average": movie_data.get("vote_average"),
-            "vote_count": movie_data.get("vote_count"),
-            "poster_path": f"https://image.tmdb.org/t/p/w500{movie_data.get('poster_path', '')}" if movie_data.get("poster_path") else None
+            "persons": [self._normalize_person(person) for person in api_response.get("results", [])[:3]],
+            "total_results": api_response.get("total_results", 0),
+            "page": api_response.get("page", 1)
         }
 
-    def _normalize_movies_list(self, api_response: Dict[str, Any], limit: int = 5) -> List[Dict[str, Any]]:
+    def _normalize_movie(self, movie_data: Dict[str, Any]) -> Movie:
+        """Normalize movie data to consistent schema"""
+        overview = movie_data.get("overview")
+        poster_path = movie_data.get("poster_path")
+        return Movie(
+            id=movie_data.get("id"),
+            title=movie_data.get("title"),
+            release_date=movie_data.get("release_date"),
+            overview=overview[:OVERVIEW_MAX_CHARS] + "..." if overview else "",
+            popularity=round(movie_data.get("popularity", 0), 2),
+            vote_average=movie_data.get("vote_average"),
+            vote_count=movie_data.get("vote_count"),
+            poster_path=POSTER_TMPL.format(poster_path) if poster_path else None
+        )
+
+    def _normalize_movies_list(self, api_response: Dict[str, Any], limit: int = 5) -> List[Movie]:
         """Normalize list of movies"""
-        movies = api_response.get("results", [])
-        normalized = []
-        
-        for movie in movies[:limit]:
-            normalized.append(self._normalize_movie(movie))
-        
-        return normalized
+        return [self._normalize_movie(movie) for movie in api_response.get("results", [])[:limit]]
 
     def _normalize_person(self, person_data: Dict[str, Any]) -> Dict[str, Any]:
         """Normalize person data"""
@@ -76,5 +95,5 @@ class ResponseParser:
 if __name__ == "__main__":
     parser = ResponseParser()
     mock_movie = {"id": 1, "title": "Test", "overview": "Test overview"}
-    normalized = parser.normalize_movie(mock_movie)
+    normalized = parser._normalize_movie(mock_movie)
     print(normalized)
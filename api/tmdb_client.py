@@ -1,26 +1,76 @@
-import requests
+import asyncio
+import atexit
+import httpx
 import os
-from dotenv import load_dotenv
-from typing import Dict, Any, Optional
-import json
+import shelve
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, Any, FrozenSet, List, Optional, Tuple
+import orjson
+from agents.base import load_env
 from agents.param_extractor import ExtractedParams
 
-load_dotenv()
-
 
 REQUEST_TIMEOUT = 10
+CONNECT_TIMEOUT = 3
+
+# HTTP/2 multiplexes concurrent requests over a single connection,
+# so a small pool is enough even for wide person lookup fan-outs.
+MAX_CONNECTIONS = 10
+MAX_KEEPALIVE_CONNECTIONS = 5
+
+# Transient TMDB failures are retried with exponential backoff; connection
+# errors are retried by the transport itself.
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.3
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Response cache freshness, in seconds. Lookup lists barely ever change;
+# everything else is kept for a short while and revalidated with its ETag.
+RESPONSE_CACHE_TTLS = {
+    "genre_list": 24 * 60 * 60,
+    "movie_certifications": 24 * 60 * 60,
+}
+DEFAULT_RESPONSE_CACHE_TTL = 15 * 60
+RESPONSE_CACHE_MAXSIZE = 256
+
+# Person name -> TMDB ID lookups never change, so they are kept in memory
+# and persisted on disk across runs.
+PERSON_ID_CACHE_MAXSIZE = 10_000
+DEFAULT_PERSON_ID_CACHE_PATH = ".cache/person_ids"
 
 
 class TMDBClient:
+    # Pooled HTTP/2 clients shared by all TMDBClient instances. Connections are bound
+    # to the event loop that opened them, so one client is kept per running loop.
+    _http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+    # (endpoint, params) -> (etag, body, expiry), in LRU order
+    _response_cache: "OrderedDict[Tuple[str, FrozenSet], Tuple[Optional[str], Dict[str, Any], float]]" = OrderedDict()
+    # normalized person name -> TMDB person ID, in LRU order, backed by a shelve file
+    _person_ids: "OrderedDict[str, int]" = OrderedDict()
+    _person_ids_store: Optional[shelve.Shelf] = None
+
     ENDPOINTS = {
         "search_movie": "/search/movie",
         "discover_movies": "/discover/movie",
         "search_person": "/search/person",
         "movie_certifications": "/certification/movie/list",
         "genre_list": "/genre/movie/list",
+        "popular_people": "/person/popular",
+    }
+    # Query parameters each endpoint accepts, looked up instead of testing every field
+    ENDPOINT_PARAMS: Dict[str, Tuple[str, ...]] = {
+        "search_movie": ("query", "primary_release_year"),
+        "discover_movies": ("primary_release_year", "with_genres", "with_people", "sort_by"),
+        "search_person": ("query",),
+        "movie_certifications": (),
+        "genre_list": (),
+        "popular_people": (),
     }
 
     def __init__(self):
+        load_env()
         self.api_key = os.getenv("TMDB_API_READ_ACCESS_TOKEN")
         self.base_url = "https://api.themoviedb.org/3"
         self.headers = {
@@ -28,34 +78,185 @@ class TMDBClient:
             "Content-Type": "application/json"
         }
 
-    def make_request(self, endpoint: str, params: ExtractedParams) -> Dict[str, Any]:
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Return the shared keep-alive client for the running event loop"""
+        loop = asyncio.get_running_loop()
+        client = self._http_clients.get(loop)
+        if client is None:
+            limits = httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+            )
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                transport=httpx.AsyncHTTPTransport(http2=True, limits=limits, retries=MAX_RETRIES),
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+            )
+            self._http_clients[loop] = client
+        return client
+
+    async def warm_up(self) -> None:
+        """
+        Open the pooled connection to TMDB ahead of the first real request, so the
+        TCP+TLS handshake can overlap with other work. Only the first call on each
+        event loop sends a request; once its client exists the connection is kept alive.
+        """
+        if asyncio.get_running_loop() in self._http_clients:
+            return
+        try:
+            await self._get_http_client().head("")
+        except httpx.HTTPError:
+            pass  # best effort: the real request will simply connect itself
+
+    async def get_genres(self) -> Dict[str, int]:
+        """Return TMDB's movie genre catalog as a lowercased name -> genre ID dict"""
+        response = await self.make_request("genre_list", ExtractedParams())
+        return {genre["name"].lower(): genre["id"] for genre in response.get("genres", [])}
+
+    async def prefetch_popular_people(self) -> None:
+        """Seed the person ID cache with the people currently popular on TMDB"""
+        response = await self.make_request("popular_people", ExtractedParams())
+        for person in response.get("results", []):
+            if person.get("name") and person.get("id") is not None:
+                self._remember_person_id(person["name"].strip().lower(), person["id"])
+
+    async def make_request(self, endpoint: str, params: ExtractedParams) -> Dict[str, Any]:
         """Make a request to the TMDB API based on the endpoint and parameters"""
 
         if endpoint not in self.ENDPOINTS:
             raise ValueError(f"Unknown endpoint: {endpoint}")
 
-        url = f"{self.base_url}{self.ENDPOINTS[endpoint]}"
-        params = self._parse_params(params)
-        response = requests.get(url, headers=self.headers, params=params, timeout=REQUEST_TIMEOUT)
+        path = self.ENDPOINTS[endpoint]
+        params = self._parse_params(endpoint, params)
+
+        cache_key = (endpoint, frozenset(params.items()))
+        cached = self._response_cache.get(cache_key)
+        headers = None
+        if cached is not None:
+            etag, body, expiry = cached
+            if expiry > time.monotonic():
+                self._response_cache.move_to_end(cache_key)
+                return body
+            if etag:
+                headers = {"If-None-Match": etag}
+
         try:
-            response.raise_for_status()
-        except requests.RequestException as e:
+            response = await self._get_with_retries(path, headers, params)
+            # 304 Not Modified: the stale cached body is still current
+            not_modified = cached is not None and response.status_code == 304
+            if not not_modified:
+                response.raise_for_status()
+        except httpx.HTTPError as e:
             raise RuntimeError(f"TMDB API error: {e}") from e
 
-        return response.json()
+        body = cached[1] if not_modified else orjson.loads(response.content)
+        # A 304 need not repeat the ETag: keep the one the cached body was stored with
+        etag = response.headers.get("ETag") or (cached[0] if not_modified else None)
+        self._store_response(cache_key, endpoint, etag, body)
+        return body
+
+    async def _get_with_retries(
+        self,
+        path: str,
+        headers: Optional[Dict[str, str]],
+        params: Dict[str, Any]
+    ) -> httpx.Response:
+        """GET through the shared client, retrying rate-limited and 5xx responses"""
+        for attempt in range(MAX_RETRIES + 1):
+            response = await self._get_http_client().get(path, headers=headers, params=params)
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+    def _store_response(
+        self,
+        cache_key: Tuple[str, FrozenSet],
+        endpoint: str,
+        etag: Optional[str],
+        body: Dict[str, Any]
+    ) -> None:
+        """Insert or refresh a response cache entry, evicting the least recently used one"""
+        ttl = RESPONSE_CACHE_TTLS.get(endpoint, DEFAULT_RESPONSE_CACHE_TTL)
+        self._response_cache[cache_key] = (etag, body, time.monotonic() + ttl)
+        self._response_cache.move_to_end(cache_key)
+        if len(self._response_cache) > RESPONSE_CACHE_MAXSIZE:
+            self._response_cache.popitem(last=False)
+
+    async def resolve_person_id(self, name: str) -> Optional[int]:
+        """Resolve a person name to its TMDB ID, going to the API only on a cache miss"""
+        name = name.strip()
+        key = name.lower()
+
+        person_id = self._cached_person_id(key)
+        if person_id is None:
+            response = await self.make_request("search_person", ExtractedParams(query=name))
+            person_id = self._extract_person_id(response)
+            if person_id is None:
+                return None
+            self._get_person_ids_store()[key] = person_id
+
+        self._remember_person_id(key, person_id)
+        return person_id
+
+    async def resolve_person_ids(self, names: List[str]) -> List[int]:
+        """
+        Resolve several person names to their TMDB IDs, in order and without duplicates.
+        Cached names are answered directly; only the misses are searched, concurrently.
+        Names that cannot be resolved are left out.
+        """
+        person_ids: Dict[str, Optional[int]] = {}
+        misses: Dict[str, str] = {}
+        for name in names:
+            name = name.strip()
+            key = name.lower()
+            if not key or key in person_ids:
+                continue
+            person_ids[key] = self._cached_person_id(key)
+            if person_ids[key] is None:
+                misses[key] = name
+
+        resolved = await asyncio.gather(*(self.resolve_person_id(name) for name in misses.values()))
+        person_ids.update(zip(misses, resolved))
+        return [person_id for person_id in person_ids.values() if person_id is not None]
+
+    def _cached_person_id(self, key: str) -> Optional[int]:
+        """Look a normalized person name up in memory, then on disk"""
+        person_id = self._person_ids.get(key)
+        if person_id is None:
+            person_id = self._get_person_ids_store().get(key)
+            if person_id is not None:
+                self._remember_person_id(key, person_id)
+        else:
+            self._person_ids.move_to_end(key)
+        return person_id
+
+    def _remember_person_id(self, key: str, person_id: int) -> None:
+        """Insert or refresh an in-memory person ID entry, evicting the least recently used one"""
+        self._person_ids[key] = person_id
+        self._person_ids.move_to_end(key)
+        if len(self._person_ids) > PERSON_ID_CACHE_MAXSIZE:
+            self._person_ids.popitem(last=False)
+
+    @classmethod
+    def _get_person_ids_store(cls) -> shelve.Shelf:
+        """Open the on-disk person ID cache on first use"""
+        if cls._person_ids_store is None:
+            path = os.getenv("PERSON_ID_CACHE_PATH", DEFAULT_PERSON_ID_CACHE_PATH)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            cls._person_ids_store = shelve.open(path)
+            atexit.register(cls._person_ids_store.close)
+        return cls._person_ids_store
 
-    def _parse_params(self, params: ExtractedParams) -> Dict[str, Any]:
-        """Convert ExtractedParams to a dictionary suitable for TMDB API"""
+    def _parse_params(self, endpoint: str, params: ExtractedParams) -> Dict[str, Any]:
+        """Convert ExtractedParams to the query parameters the TMDB endpoint accepts"""
         parsed_params = {}
-        parsed_params["sort_by"] = params.sort_by or "popularity.desc"
-        if params.query:
-            parsed_params["query"] = params.query
-        if params.primary_release_year:
-            parsed_params["primary_release_year"] = params.primary_release_year
-        if params.with_genres:
-            parsed_params["with_genres"] = params.with_genres
-        if params.with_people:
-            parsed_params["with_people"] = params.with_people
+        for field in self.ENDPOINT_PARAMS[endpoint]:
+            value = getattr(params, field)
+            if value:
+                parsed_params[field] = value
+        if endpoint == "discover_movies":
+            parsed_params.setdefault("sort_by", "popularity.desc")
 
         return parsed_params
 
@@ -70,5 +271,5 @@ class TMDBClient:
 if __name__ == "__main__":
     client = TMDBClient()
     params = ExtractedParams(query="Inception")
-    result = client.make_request("search_movie", params)
-    print(json.dumps(result, indent=2))
+    result = asyncio.run(client.make_request("search_movie", params))
+    print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
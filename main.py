@@ -1,11 +1,38 @@
+from __future__ import annotations
 from pydantic import BaseModel, Field
-from agents.router_agent import RouterAgent
-from agents.param_extractor import ParameterExtractor, ExtractedParams
-from api.tmdb_client import TMDBClient
-from api.response_parser import ResponseParser
-from agents.answer_generator import AnswerGenerator
-from typing import Dict, Any, Optional
-import json
+from typing import TYPE_CHECKING, Callable, Dict, Any, List, Optional
+from dataclasses import asdict
+import asyncio
+import logging
+import os
+import time
+import orjson
+
+# The agents pull in the OpenAI SDK, httpx and numpy; they are imported when the
+# orchestrator is built so that the CLI starts (and shows its menu) quickly.
+if TYPE_CHECKING:
+    from agents.param_extractor import ExtractedParams
+
+
+MAX_CONCURRENT_QUERIES = 10
+RESULT_CACHE_MAXSIZE = 1024
+RESULT_CACHE_TTL = 3600
+RESULT_SEMANTIC_CACHE_THRESHOLD = 0.92
+# TMDB's genre catalog, persisted across runs
+DEFAULT_GENRE_CACHE_PATH = ".cache/genres.json"
+GENRE_CACHE_TTL = 7 * 24 * 60 * 60
+# Large payloads are only logged as a truncated preview
+DEBUG_PREVIEW_CHARS = 200
+
+logger = logging.getLogger("tmdb_agent")
+
+
+def _preview(data: Any) -> str:
+    """Serialize data for a debug log line, truncated to DEBUG_PREVIEW_CHARS"""
+    text = orjson.dumps(data).decode()
+    if len(text) > DEBUG_PREVIEW_CHARS:
+        return f"{text[:DEBUG_PREVIEW_CHARS]}... ({len(text)} chars)"
+    return text
 
 
 class StepResult(BaseModel):
@@ -24,76 +51,237 @@ class TMDBMovieAgent:
     """Main orchestrator for the multi-agent pipeline"""
 
     def __init__(self):
-        self.router = RouterAgent()
-        self.extractor = ParameterExtractor()
+        from agents.combined_agent import RouteAndExtractAgent
+        from api.tmdb_client import TMDBClient
+        from api.response_parser import ResponseParser
+        from agents.answer_generator import AnswerGenerator
+        from agents.base import load_env
+        from agents.cache import InMemoryCache
+        from agents.semantic_cache import SemanticCache
+
+        self.router = RouteAndExtractAgent()
         self.tmdb_client = TMDBClient()
         self.parser = ResponseParser()
         self.generator = AnswerGenerator()
+        # Final pipeline results keyed on the normalized query, stored as JSON so
+        # every hit hands out a fresh copy that callers are free to mutate
+        self._result_cache = InMemoryCache(maxsize=RESULT_CACHE_MAXSIZE, ttl=RESULT_CACHE_TTL)
+        # Near-duplicate phrasings of a cached query reuse its result as well
+        load_env()
+        self._semantic_result_cache = SemanticCache(
+            path=os.getenv("RESULT_SEMANTIC_CACHE_PATH", ".cache/result_semantic_cache.npz"),
+            threshold=float(os.getenv("RESULT_SEMANTIC_CACHE_THRESHOLD", RESULT_SEMANTIC_CACHE_THRESHOLD)),
+            ttl=RESULT_CACHE_TTL
+        )
+        # Lookup tables (genre catalog, popular people) are fetched by the first query,
+        # alongside its routing call, unless a fresh genre catalog is already on disk
+        self._genres_path = os.getenv("GENRE_CACHE_PATH", DEFAULT_GENRE_CACHE_PATH)
+        self._genres = self._load_genres()
+        if self._genres:
+            self.router.genre_map = self._genres
+        self._prefetched = False
+        self._prefetching = False
 
     def process_query(self, user_query: str) -> Dict[str, Any]:
-        """Process user query through the full pipeline"""
+        """Blocking entrypoint that runs the async pipeline to completion"""
+        return asyncio.run(self.process_query_async(user_query))
 
-        print(f"\n🔍 Processing query: '{user_query}'")
+    async def process_many(self, user_queries: List[str]) -> List[Dict[str, Any]]:
+        """
+        Process a batch of user queries concurrently. The number of in-flight
+        pipelines is bounded by MAX_CONCURRENT_QUERIES to stay within API rate limits.
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
 
-        # Step 1: Router Agent
-        print("1️⃣ Router Agent: Determining endpoint...")
-        route_result = self._safe_route(user_query)
-        if not route_result.success:
-            return self._error_response(route_result, user_query)
+        async def bounded(user_query: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.process_query_async(user_query)
 
-        decision = route_result.data
+        return await asyncio.gather(*(bounded(q) for q in user_queries))
 
-        # Step 2: Parameter Extractor
-        print("2️⃣ Parameter Extractor: Extracting parameters...")
-        extract_result = self._safe_extract(user_query, decision.endpoint)
-        if not extract_result.success:
-            return self._error_response(extract_result, user_query)
+    async def process_query_async(
+        self,
+        user_query: str,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Process user query through the full pipeline. If on_token is given, the
+        final answer is streamed to it chunk by chunk while it is being generated.
+        """
 
-        params = extract_result.data
+        logger.info("🔍 Processing query: '%s'", user_query)
+
+        query_norm = user_query.strip().lower()
+        cached = self._result_cache.get(query_norm)
+        if cached is not None:
+            return self._cached_response(orjson.loads(cached), user_query, on_token)
+
+        # Step 1: Router Agent (routing and parameter extraction in one LLM call).
+        # It runs while the query is embedded for the semantic cache lookup, so a
+        # cache miss does not pay for the two calls in sequence.
+        # The TMDB connection is opened meanwhile, so the person lookups and the
+        # main API call that follow do not wait on a handshake.
+        logger.info("1️⃣ Router Agent: Determining endpoint and extracting parameters...")
+        route_task = asyncio.create_task(self._safe_route(user_query))
+        warm_up_task = asyncio.create_task(self._warm_up())
+        query_vector = await self._safe_embed(query_norm)
+        similar = self._semantic_result_cache.lookup(query_vector) if query_vector is not None else None
+
+        route_result = await route_task
+        await warm_up_task
+        if not route_result.success:
+            return self._error_response(route_result, user_query)
 
-        # Step 2.5: Resolve people names → IDs
-        resolve_result = self._resolve_people(params)
+        decision = route_result.data
+        params = decision.params
+        logger.debug("   Decision: %s (%s)", decision.endpoint, decision.reasoning)
+
+        # A near-duplicate query is only reused when it routes to the very same TMDB
+        # call: "comedy movies from 2022" and "... from 2023" embed almost identically
+        if similar is not None:
+            cached = orjson.loads(similar)
+            if self._same_call(cached, decision.endpoint, params):
+                return self._cached_response(cached, user_query, on_token)
+
+        # Step 1.5: Resolve people names → IDs
+        resolve_result = await self._resolve_people(params)
         if not resolve_result.success:
             return self._error_response(resolve_result, user_query)
 
         params = resolve_result.data
 
-        # Step 3: API Execution
-        print("3️⃣ API Executor: Calling TMDB API...")
-        api_call_result = self._safe_api_call(decision.endpoint, params)
+        # Step 2: API Execution
+        logger.info("2️⃣ API Executor: Calling TMDB API...")
+        api_call_result = await self._safe_api_call(decision.endpoint, params)
         if not api_call_result.success:
             return self._error_response(api_call_result, user_query)
         api_response = api_call_result.data
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("   API response: %s", _preview(api_response))
 
-        # Step 4: Response Parsing
-        print("4️⃣ Response Parser: Normalizing data...")
+        # Step 3: Response Parsing
+        logger.info("3️⃣ Response Parser: Normalizing data...")
         parse_result = self._safe_parse(decision.endpoint, api_response)
         if not parse_result.success:
             return self._error_response(parse_result, user_query)
         
         normalized_data = parse_result.data
+
+        params_dict = params.model_dump()
+        logger.debug("   Extracted params: %s", params_dict)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("   Normalized data: %s", _preview(normalized_data))
+        # Movies are slotted dataclasses; the result holds plain dicts, as cached results do
         movies = normalized_data.get("movies", [])
-        api_response_sample = movies[:2] if "movies" in normalized_data else normalized_data
+        api_response_sample = [asdict(movie) for movie in movies[:2]] if "movies" in normalized_data else normalized_data
 
-        # Step 5: Answer Generation
-        print("5️⃣ Answer Generator: Creating structured answer...")
-        answer_result = self._safe_generate_answer(
+        # Step 4: Answer Generation
+        logger.info("4️⃣ Answer Generator: Creating structured answer...")
+        answer_result = await self._safe_generate_answer(
             user_query, 
             normalized_data, 
-            decision.endpoint
+            decision.endpoint,
+            on_token
         )
         if not answer_result.success:
             return self._error_response(answer_result, user_query)
         
         final_answer = answer_result.data
+        answer_dict = final_answer.model_dump()
 
-        return {
+        result = {
             "query": user_query,
             "endpoint_used": decision.endpoint,
-            "extracted_params": params.model_dump(),
+            "extracted_params": params_dict,
             "api_response_sample": api_response_sample,
-            "final_answer": final_answer.model_dump()
+            "final_answer": answer_dict
         }
+        result_json = orjson.dumps(result).decode()
+        self._result_cache.set(query_norm, result_json)
+        if query_vector is not None:
+            self._semantic_result_cache.add(query_vector, result_json)
+        return result
+
+    async def prefetch(self) -> None:
+        """
+        Fetch the lookup tables queries depend on: the genre catalog (unless loaded
+        from disk) and the popular people, which seed the person ID cache.
+        Best effort: anything that fails is resolved on demand, and the prefetch is
+        retried by a later query. Concurrent queries do not start a second prefetch.
+        """
+        self._prefetching = True
+        try:
+            genres, people = await asyncio.gather(
+                self.tmdb_client.get_genres() if not self._genres else asyncio.sleep(0),
+                self.tmdb_client.prefetch_popular_people(),
+                return_exceptions=True
+            )
+        finally:
+            self._prefetching = False
+        if isinstance(genres, dict) and genres:
+            self._genres = genres
+            self.router.genre_map = genres
+            self._save_genres(genres)
+        self._prefetched = bool(self._genres) and not isinstance(people, BaseException)
+
+    async def _warm_up(self) -> None:
+        """Open the TMDB connection once per event loop, prefetching the lookup tables on first use"""
+        if self._prefetched or self._prefetching:
+            await self.tmdb_client.warm_up()
+        else:
+            await self.prefetch()
+
+    def _load_genres(self) -> Optional[Dict[str, int]]:
+        """Read the persisted genre catalog, unless it is missing or older than GENRE_CACHE_TTL"""
+        try:
+            if time.time() - os.path.getmtime(self._genres_path) > GENRE_CACHE_TTL:
+                return None
+            with open(self._genres_path, "rb") as f:
+                return orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+
+    def _save_genres(self, genres: Dict[str, int]) -> None:
+        """Persist the genre catalog for later runs"""
+        try:
+            os.makedirs(os.path.dirname(self._genres_path) or ".", exist_ok=True)
+            with open(self._genres_path, "wb") as f:
+                f.write(orjson.dumps(genres))
+        except OSError:
+            pass  # the catalog is simply fetched again next run
+
+    def _cached_response(
+        self,
+        result: Dict[str, Any],
+        user_query: str,
+        on_token: Optional[Callable[[str], None]]
+    ) -> Dict[str, Any]:
+        """Return a decoded cached pipeline result for user_query, replaying its answer to on_token if given"""
+        logger.info("♻️ Returning cached result")
+        result["query"] = user_query
+        if on_token:
+            on_token(orjson.dumps(result["final_answer"]).decode())
+        return result
+
+    def _same_call(self, result: Dict[str, Any], endpoint: str, params: ExtractedParams) -> bool:
+        """
+        Whether a cached result was produced by the same endpoint and extracted params.
+        with_people is left out: it only holds the person IDs resolved from with_people_names.
+        """
+        cached_params = {key: value for key, value in result["extracted_params"].items() if key != "with_people"}
+        return result["endpoint_used"] == endpoint and cached_params == params.model_dump(exclude={"with_people"})
+
+    async def _safe_embed(self, query: str) -> Optional[Any]:
+        """
+        Embed the query for the semantic result cache. The cache is an optimization
+        only, so an embedding failure just disables it for this query.
+        """
+        from agents.semantic_cache import embed
+
+        try:
+            return await embed(query)
+        except Exception:
+            return None
 
     def _error_response(self, step_result: StepResult, user_query: str) -> Dict[str, Any]:
         """
@@ -108,68 +296,35 @@ class TMDBMovieAgent:
             "confidence": 0.0
         }
 
-    def _safe_route(self, query: str) -> StepResult:
+    async def _safe_route(self, query: str) -> StepResult:
         """
-        Wrapper method around self.router.route that wraps the object returned
+        Wrapper method around self.router.route_and_extract that wraps the object returned
         into a StepResult data model.
         """
         try:
-            decision = self.router.route(query)
-            return StepResult(
-                success=True,
-                data=decision,
-                metadata={
-                    "endpoint": decision.endpoint,
-                    "fallback": "Fallback" in decision.reasoning
-                }
-            )
+            decision = await self.router.route_and_extract(query)
+            return StepResult(success=True, data=decision)
         except Exception as e:
             return StepResult(
                 success=False,
                 error=f"Routing failed: {str(e)}"
             )
     
-    def _safe_extract(self, query: str, endpoint: str) -> StepResult:
-        """
-        Wrapper method around self.extractor.extract that wraps the object returned
-        into a StepResult data model.
-        """
-        try:
-            params = self.extractor.extract(query, endpoint)
-            return StepResult(
-                success=True,
-                data=params,
-                metadata={"params": params.model_dump()}
-            )
-        except Exception as e:
-            return StepResult(
-                success=False,
-                error=f"Parameter extraction failed: {str(e)}"
-            )
-
-    def _resolve_people(self, params: ExtractedParams) -> StepResult:
+    async def _resolve_people(self, params: ExtractedParams) -> StepResult:
         """
         Utility method that resolves actor names from the user input query
         to their IDs used in the TMDB database.
-        This method acts as a hidden step because it makes another call
-        to the TMDB API.
+        This method acts as a hidden step because it makes further calls
+        to the TMDB API: names are deduplicated and only those missing from
+        the person ID cache are looked up, concurrently.
         """
         if not params.with_people_names:
             return StepResult(success=True, data=params)
 
         try:
-            people_ids = []
-
-            for name in params.with_people_names.split(","):
-                response = self.tmdb_client.make_request(
-                    "search_person",
-                    ExtractedParams(query=name.strip())
-                )
-                results = response.get("results", [])
-                if results:
-                    people_ids.append(str(results[0]["id"]))
+            people_ids = await self.tmdb_client.resolve_person_ids(params.with_people_names.split(","))
             if people_ids:
-                params.with_people = ",".join(people_ids)
+                params.with_people = ",".join(str(person_id) for person_id in people_ids)
 
             return StepResult(success=True, data=params)
         except Exception as e:
@@ -178,18 +333,14 @@ class TMDBMovieAgent:
                 error=f"People resolution failed: {str(e)}"
             )
 
-    def _safe_api_call(self, endpoint: str, params: ExtractedParams) -> StepResult:
+    async def _safe_api_call(self, endpoint: str, params: ExtractedParams) -> StepResult:
         """
         Wrapper method around self.tmdb_client.make_request that wraps the object returned
         into a StepResult data model.
         """
         try:
-            response = self.tmdb_client.make_request(endpoint, params)
-            return StepResult(
-                success=True,
-                data=response,
-                metadata={"raw_response": response}
-            )
+            response = await self.tmdb_client.make_request(endpoint, params)
+            return StepResult(success=True, data=response)
         except Exception as e:
             return StepResult(
                 success=False,
@@ -203,29 +354,27 @@ class TMDBMovieAgent:
         """
         try:
             normalized_data = self.parser.parse_response(endpoint, response)
-            return StepResult(
-                success=True,
-                data=normalized_data,
-                metadata={"normalized_data": normalized_data}
-            )
+            return StepResult(success=True, data=normalized_data)
         except Exception as e:
             return StepResult(
                 success=False,
                 error=f"Response parsing failed: {str(e)}"
             )
     
-    def _safe_generate_answer(self, query: str, data: Any, endpoint: str) -> StepResult:
+    async def _safe_generate_answer(
+        self,
+        query: str,
+        data: Any,
+        endpoint: str,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> StepResult:
         """
         Wrapper method around self.generator.generate_answer that wraps the object returned
         into a StepResult data model.
         """
         try:
-            answer = self.generator.generate_answer(query, data, endpoint)
-            return StepResult(
-                success=True,
-                data=answer,
-                metadata={"final_answer": answer.model_dump()}
-            )
+            answer = await self.generator.generate_answer(query, data, endpoint, on_token)
+            return StepResult(success=True, data=answer)
         except Exception as e:
             return StepResult(
                 success=False,
@@ -234,34 +383,82 @@ class TMDBMovieAgent:
 
 
 if __name__ == "__main__":
+    import contextvars
     import sys
 
+    logging.basicConfig(format="%(message)s")
+    logger.setLevel(logging.INFO)
 
-    agent = TMDBMovieAgent()
+    # uvloop is optional: a faster event loop for the pipeline's concurrent I/O.
+    # asyncio.Runner takes it as a loop factory on Python 3.11+; older versions
+    # install its event loop policy instead.
+    loop_factory = None
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            if sys.version_info >= (3, 11):
+                loop_factory = uvloop.new_event_loop
+            else:
+                uvloop.install()
+        except ImportError:
+            pass
+
+    example_queries = [
+        "Find action movies from 2023",
+        "Search for movies with Leonardo DiCaprio",
+        "What are the details of the movie Inception?",
+        "Find comedy movies from 2022",
+        "Who is Tom Hanks and what movies is he known for?"
+    ]
+
+    # Set in the context of the example warm-up tasks, whose step logs are kept below
+    # WARNING so they do not interleave with the prompt and the chosen query's output
+    warming_up = contextvars.ContextVar("warming_up", default=False)
+    logger.addFilter(lambda record: record.levelno >= logging.WARNING or not warming_up.get())
+
+    async def run_cli() -> Dict[str, Any]:
+        """
+        Ask for a query and process it. While the user is choosing, the example queries
+        are already running in the background, so picking one returns without waiting.
+        """
+        if len(sys.argv) > 1:
+            return await TMDBMovieAgent().process_query_async(" ".join(sys.argv[1:]))
 
-    if len(sys.argv) > 1:
-        query = " ".join(sys.argv[1:])
-    else:
-        example_queries = [
-            "Find action movies from 2023",
-            "Search for movies with Leonardo DiCaprio",
-            "What are the details of the movie Inception?",
-            "Find comedy movies from 2022",
-            "Who is Tom Hanks and what movies is he known for?"
-        ]
         print("\n🎬 TMDB Movie Agent - Example Queries:")
         for i, q in enumerate(example_queries, 1):
             print(f"{i}. {q}")
 
-        choice = input("\nEnter query number or type your own: ")
+        # Built after the menu is shown: this is where the heavy imports happen
+        agent = TMDBMovieAgent()
+        token = warming_up.set(True)
+        warm_up_tasks = {
+            q.strip().lower(): asyncio.create_task(agent.process_query_async(q))
+            for q in example_queries
+        }
+        warming_up.reset(token)
+        choice = await asyncio.to_thread(input, "\nEnter query number or type your own: ")
 
-        if choice.isdigit() and 1 <= int(choice) <= len(example_queries):
-            query = example_queries[int(choice) - 1]
+        try:
+            n = int(choice)
+        except ValueError:
+            n = 0
+        if 1 <= n <= len(example_queries):
+            query = example_queries[n - 1]
         else:
             query = choice if choice else example_queries[0]
 
+        warm_up_task = warm_up_tasks.get(query.strip().lower())
+        if warm_up_task is not None:
+            return await warm_up_task
+        # Unfinished warm-ups are cancelled when the event loop shuts down
+        return await agent.process_query_async(query)
+
     try:
-        result = agent.process_query(query)
+        if sys.version_info >= (3, 11):
+            with asyncio.Runner(loop_factory=loop_factory) as runner:
+                result = runner.run(run_cli())
+        else:
+            result = asyncio.run(run_cli())
 
         print("\n" + "="*50)
         print("🎉 FINAL RESULT")
@@ -277,7 +474,7 @@ if __name__ == "__main__":
         print(result['final_answer']['answer'])
 
         print(f"\n📈 Data Summary:")
-        print(json.dumps(result['final_answer']['data_summary'], indent=2))
+        print(orjson.dumps(result['final_answer']['data_summary'], option=orjson.OPT_INDENT_2).decode())
 
         print(f"\n🔗 Source: {result['final_answer']['source']}")
         print(f"📊 Confidence: {result['final_answer']['confidence']}")